@@ -18,39 +18,107 @@
 import subprocess
 import os
 import shutil
+import threading
+import time
 import argparse
-import toml
+import hashlib
+import json
+import tempfile
+import concurrent.futures
+import tomli_w
 from bellande_parser.bellande_parser import Bellande_Format
 
+# Set from --debug in main(); diagnostics are only produced when enabled
+DEBUG = False
+
+# Persistent cache for dependencies, cargo target directories and executables; cache failures never fail a build
+CACHE_DIR = os.path.expanduser(os.path.join('~', '.cache', 'bellande_rust'))
+
+# Cached executables and target directories unused for this long are pruned
+CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# Directories already created by ensure_directory during this run; reset at the start of main()
+_created_dirs = set()
+
 def ensure_directory(path):
     """Ensure a directory exists and create one if it does not"""
+    if path in _created_dirs:
+        return
     os.makedirs(path, exist_ok=True)
+    _created_dirs.add(path)
 
-def copy_source_files(src_dir, dest_dir):
-    """Maintained the structure of the src file; or assigned"""
+def fast_copy(src_path, dest_path):
+    """Copy file contents only, using copy_file_range (reflink on CoW filesystems) when available"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dest.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            # A short return before the expected size leaves a truncated copy; redo it with copyfile
+            if remaining <= 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(src_path, dest_path)
+
+def walk_source_files(src_dir, rel_dir=""):
+    """Yield (src_path, rel_path, st_mtime_ns, st_size) for every file under src_dir using os.scandir"""
+    # Like os.walk, symlinked directories are neither followed nor treated as files
+    with os.scandir(src_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_source_files(entry.path, rel_dir + entry.name + os.sep)
+            elif entry.is_file():
+                st = entry.stat()
+                yield entry.path, rel_dir + entry.name, st.st_mtime_ns, st.st_size
+
+def scan_sources(src_dir):
+    """Walk the source directory once; the result feeds both the build fingerprint and the copy"""
     if not os.path.exists(src_dir):
         raise FileNotFoundError(f"Source directory '{src_dir}' not found")
-    
+    return sorted(walk_source_files(src_dir))
+
+def copy_files(entries, src_dir, dest_dir):
+    """Maintained the structure of the src file; or assigned"""
     dest_src_dir = os.path.join(dest_dir, 'src')
+    # Drop leftovers from an interrupted run; writing through a stale hardlink would clobber the source
+    shutil.rmtree(dest_src_dir, ignore_errors=True)
+    _created_dirs.clear()
     ensure_directory(dest_src_dir)
     
-    for root, _, files in os.walk(src_dir):
-        for file in files:
-            src_path = os.path.join(root, file)
-            rel_path = os.path.relpath(src_path, src_dir)
-            dest_path = os.path.join(dest_src_dir, rel_path)
-            ensure_directory(os.path.dirname(dest_path))
-            shutil.copy2(src_path, dest_path)
+    copy_pairs = [(src_path, os.path.join(dest_src_dir, rel_path))
+                  for src_path, rel_path, _, _ in entries]
+    
+    # Create every destination directory up front so the copy workers never touch os.makedirs
+    for dest_parent in {os.path.dirname(dest_path) for _, dest_path in copy_pairs}:
+        ensure_directory(dest_parent)
+    
+    # Hardlinks cost one metadata operation per file when both trees share a filesystem
+    if os.stat(src_dir).st_dev == os.stat(dest_src_dir).st_dev:
+        for src_path, dest_path in copy_pairs:
+            try:
+                os.link(src_path, dest_path)
+            except OSError:
+                fast_copy(src_path, dest_path)
+        return
+    
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda pair: fast_copy(*pair), copy_pairs))
 
-def create_cargo_toml(project_dir, main_file, binary_name):
-    """Create a Cargo.toml file for a binary target."""
+def create_cargo_toml(project_dir, main_file, binary_name, dependencies):
+    """Create a Cargo.toml file for a binary target with its dependencies in a single write."""
     cargo_config = {
         'package': {
             'name': binary_name,
             'version': "0.1.0",
             'edition': "2021"
         },
-        'dependencies': {}
+        'dependencies': dependencies
     }
     
     if main_file != 'main.rs':
@@ -60,11 +128,29 @@ def create_cargo_toml(project_dir, main_file, binary_name):
         }]
     
     cargo_toml_path = os.path.join(project_dir, 'Cargo.toml')
-    with open(cargo_toml_path, 'w') as f:
-        toml.dump(cargo_config, f)
+    with open(cargo_toml_path, 'wb') as f:
+        tomli_w.dump(cargo_config, f)
+
+def digest_file(path):
+    """Return a blake2b digest of the file contents"""
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
 
-def parse_dependencies(dep_file):
+def parse_dependencies(dep_file, dep_digest):
     """Parse dependencies from the specified .bellande file using Bellande_Format."""
+    path_digest = hashlib.blake2b(os.path.abspath(dep_file).encode(), digest_size=16).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"deps_{path_digest}.json")
+    
+    try:
+        with open(cache_path, 'r') as f:
+            cached = json.load(f)
+        if cached.get('key') == dep_digest:
+            if DEBUG:
+                print(f"Using cached dependencies from {cache_path}")
+            return cached['deps']
+    except (OSError, ValueError):
+        pass
+    
     bellande_parser = Bellande_Format()
     parsed_data = bellande_parser.parse_bellande(dep_file)
     
@@ -72,45 +158,150 @@ def parse_dependencies(dep_file):
     dependencies = eval(parsed_data)
     
     # Process the dependencies to match Cargo.toml format
-    processed_dependencies = {}
-    for name, value in dependencies.items():
-        if isinstance(value, str):
-            processed_dependencies[name] = value
-        elif isinstance(value, dict):
-            processed_dependencies[name] = value
+    processed_dependencies = {name: value for name, value in dependencies.items()
+                              if isinstance(value, (str, dict))}
+    
+    if DEBUG:
+        print(f"Parsed dependencies: {json.dumps(processed_dependencies, indent=2)}")
+    
+    # Write a private temp file and rename it so readers never see a partial cache
+    temp_path = None
+    try:
+        ensure_directory(CACHE_DIR)
+        fd, temp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'key': dep_digest, 'deps': processed_dependencies}, f)
+        os.replace(temp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        if temp_path is not None and os.path.exists(temp_path):
+            os.unlink(temp_path)
     
     return processed_dependencies
 
-def update_cargo_toml_dependencies(project_dir, dependencies):
-    """Update the dependencies in Cargo.toml."""
-    cargo_toml_path = os.path.join(project_dir, 'Cargo.toml')
-    with open(cargo_toml_path, 'r') as f:
-        cargo_config = toml.load(f)
+def get_target_dir(src_dir, binary_name, dependencies):
+    """Persistent cargo target directory for one project, binary and dependency set"""
+    target_key = json.dumps([os.path.abspath(src_dir), binary_name, dependencies], sort_keys=True)
+    target_digest = hashlib.blake2b(target_key.encode(), digest_size=8).hexdigest()
+    return os.path.join(CACHE_DIR, f"target_{binary_name}_{target_digest}")
+
+def fingerprint_build(entries, dep_digest, main_file, binary_name):
+    """Fingerprint source file metadata, dependency file contents and target names"""
+    fingerprint = hashlib.blake2b(digest_size=16)
+    for src_path, _, mtime_ns, size in entries:
+        fingerprint.update(f"{os.path.abspath(src_path)}\0{mtime_ns}\0{size}\0".encode())
+    fingerprint.update(f"{dep_digest}\0{main_file}\0{binary_name}".encode())
+    return fingerprint.hexdigest()
+
+def publish_output(src_path, output_path):
+    """Copy an executable to output_path as a file of its own"""
+    # Replace a regular file rather than writing into its inode, which may be running or hardlinked;
+    # a symlinked output is written through like shutil.copy2 does
+    if os.path.isfile(output_path) and not os.path.islink(output_path):
+        os.unlink(output_path)
+    fast_copy(src_path, output_path)
+    shutil.copymode(src_path, output_path)
+
+def store_cached_executable(output_path, cached_exe):
+    """Store a copy of the built executable in the cache"""
+    temp_path = None
+    try:
+        ensure_directory(CACHE_DIR)
+        fd, temp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        os.close(fd)
+        # An independent copy: the cache must never share an inode with a user-facing path
+        shutil.copy2(output_path, temp_path)
+        os.replace(temp_path, cached_exe)
+    except OSError as e:
+        if temp_path is not None and os.path.exists(temp_path):
+            os.unlink(temp_path)
+        if DEBUG:
+            print(f"Could not cache executable: {e}")
+
+def prune_cache():
+    """Remove cache entries unused for CACHE_MAX_AGE"""
+    cutoff = time.time() - CACHE_MAX_AGE
+    try:
+        with os.scandir(CACHE_DIR) as entries:
+            stale = [entry for entry in entries
+                     if entry.name.startswith(('exe_', 'target_'))
+                     and entry.stat(follow_symlinks=False).st_mtime < cutoff]
+    except OSError:
+        return
+    for entry in stale:
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+def get_jobserver_fds(makeflags):
+    """Return the pipe fds of an inherited make jobserver, () for fifo/named forms, or None without one"""
+    auth = None
+    for flag in makeflags.split():
+        for prefix in ('--jobserver-auth=', '--jobserver-fds='):
+            if flag.startswith(prefix):
+                auth = flag[len(prefix):]
+    if auth is None:
+        return None
     
-    cargo_config['dependencies'] = dependencies
+    try:
+        fds = tuple(int(fd) for fd in auth.split(','))
+    except ValueError:
+        # fifo:PATH (or a Windows semaphore name) reaches cargo through MAKEFLAGS alone
+        return ()
     
-    with open(cargo_toml_path, 'w') as f:
-        toml.dump(cargo_config, f)
+    # make hides the pipe from recipes it does not consider recursive; then there is nothing to share
+    try:
+        for fd in fds:
+            os.fstat(fd)
+    except OSError:
+        return None
+    return fds
 
-def build_project(project_dir, output_path, binary_name):
+def build_project(project_dir, output_path, binary_name, target_dir):
     """Build the Rust project as an executable."""
+    # Prepare the output directory while cargo is running
+    output_dir = os.path.dirname(output_path) or '.'
+    prepare_output = threading.Thread(target=ensure_directory, args=(output_dir,))
+    prepare_output.start()
+    
+    if DEBUG:
+        version_check = subprocess.run(['cargo', '--version'], capture_output=True, text=True)
+        print(f"Using {version_check.stdout.strip()}")
+    
     cargo_command = ['cargo', 'build', '--release']
-    result = subprocess.run(cargo_command, cwd=project_dir, capture_output=True, text=True)
+    # Under an outer make jobserver cargo shares its pool; the pipe fds must survive into the child
+    jobserver_fds = get_jobserver_fds(os.environ.get('MAKEFLAGS', ''))
+    if jobserver_fds is None:
+        jobserver_fds = ()
+        cargo_command += ['--jobs', str(os.cpu_count() or 1)]
+    env = {**os.environ, 'CARGO_TARGET_DIR': target_dir}
+    # Refresh the target directory's mtime so prune_cache sees it as in use
+    try:
+        os.utime(target_dir)
+    except OSError:
+        pass
+    
+    try:
+        # Cargo inherits our stdio so its output (colors, progress) streams directly instead of being buffered
+        returncode = subprocess.run(cargo_command, cwd=project_dir, env=env,
+                                    pass_fds=jobserver_fds).returncode
+    finally:
+        prepare_output.join()
     
-    if result.returncode == 0:
+    if returncode == 0:
         exe_extension = '.exe' if os.name == 'nt' else ''
-        built_exe = os.path.join(project_dir, 'target', 'release', f"{binary_name}{exe_extension}")
-        ensure_directory(os.path.dirname(output_path))
-        shutil.copy2(built_exe, output_path)
+        built_exe = os.path.join(target_dir, 'release', f"{binary_name}{exe_extension}")
+        publish_output(built_exe, output_path)
         
         if os.name != 'nt':
             os.chmod(output_path, 0o755)
         
         return True
     else:
-        print("Build failed. Cargo output:")
-        print(result.stdout)
-        print(result.stderr)
+        print(f"Build failed. Cargo exited with status {returncode}")
         return False
 
 def main():
@@ -119,23 +310,48 @@ def main():
     parser.add_argument("-s", "--src-dir", required=True, help="Source directory containing Rust files")
     parser.add_argument("-m", "--main-file", required=True, help="Main Rust file name (e.g., main.rs)")
     parser.add_argument("-o", "--output", required=True, help="Output path for the compiled executable")
+    parser.add_argument("--debug", action="store_true", help="Print diagnostic output while building")
     
     args = parser.parse_args()
     
+    global DEBUG
+    DEBUG = args.debug
+    _created_dirs.clear()
+    
     binary_name = os.path.splitext(args.main_file)[0]
+    exe_extension = '.exe' if os.name == 'nt' else ''
+    output_path = f"{args.output}{exe_extension}"
+    # Like shutil.copy2, an existing directory receives the executable under its own name
+    if os.path.isdir(output_path):
+        output_path = os.path.join(output_path, f"{binary_name}{exe_extension}")
+    
+    # Nothing changed since a previous build: reuse its executable and skip the pipeline
+    entries = scan_sources(args.src_dir)
+    dep_digest = digest_file(args.dep_file)
+    fingerprint = fingerprint_build(entries, dep_digest, args.main_file, binary_name)
+    cached_exe = os.path.join(CACHE_DIR, f"exe_{fingerprint}")
+    if os.path.isfile(cached_exe):
+        try:
+            os.utime(cached_exe)
+        except OSError:
+            pass
+        ensure_directory(os.path.dirname(output_path) or '.')
+        publish_output(cached_exe, output_path)
+        print(f"Sources unchanged; copied cached build to {output_path}")
+        return 0
+    
     build_dir = f"build_{binary_name}"
     ensure_directory(build_dir)
     
     try:
-        copy_source_files(args.src_dir, build_dir)
-        create_cargo_toml(build_dir, args.main_file, binary_name)
-        
-        dependencies = parse_dependencies(args.dep_file)
-        update_cargo_toml_dependencies(build_dir, dependencies)
-        
-        output_path = f"{args.output}.exe" if os.name == 'nt' else args.output
+        copy_files(entries, args.src_dir, build_dir)
+        dependencies = parse_dependencies(args.dep_file, dep_digest)
+        create_cargo_toml(build_dir, args.main_file, binary_name, dependencies)
         
-        if build_project(build_dir, output_path, binary_name):
+        target_dir = get_target_dir(args.src_dir, binary_name, dependencies)
+        if build_project(build_dir, output_path, binary_name, target_dir):
+            store_cached_executable(output_path, cached_exe)
+            prune_cache()
             print(f"Successfully built and copied to {output_path}")
             return 0
         else: